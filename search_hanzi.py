@@ -1,18 +1,205 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
 import re
-from typing import List
+from typing import Dict, List, Optional, Tuple
 import html as html_lib
 
+import aiohttp
+
+# selectolax (C-backed) parse HTML nhanh hơn regex nhiều; nếu chưa cài
+# thì vẫn chạy được bằng đường regex cũ.
+try:
+    from selectolax.parser import HTMLParser as _SelectolaxParser
+except ImportError:
+    _SelectolaxParser = None
+
 # URL PHP phiên âm Hán-Việt
 NGUYENDU_URL = "http://nguyendu.com.free.fr/hanviet/hv_phienam_dtk.php"
 
+# Regex biên dịch sẵn một lần ở mức module (các hàm parse/clean được gọi
+# cho từng dòng/đoạn nên đừng để re phải tra cache pattern mỗi lần)
+_RE_BLOCKS = re.compile(
+    r"<div[^>]+class=['\"]div-td-scrolls['\"][^>]*>(.*?)</div>",
+    re.S | re.I,
+)
+_RE_BODY = re.compile(r"<body[^>]*>(.*?)</body>", re.S | re.I)
+_RE_SCRIPT = re.compile(r"<script.*?</script>", re.S | re.I)
+_RE_STYLE = re.compile(r"<style.*?</style>", re.S | re.I)
+_RE_TAG = re.compile(r"<[^>]+>")
+_RE_WS = re.compile(r"\s+")
+# Bảng + regex gộp cho _clean_phienam_text: thay vì 5-6 lượt sub/replace
+# (mỗi lượt cấp phát một chuỗi mới), chỉ còn 1 lượt translate + 1 lượt sub.
+_TRANS_WS = str.maketrans({"\r": " ", "\n": " ", "\t": " "})
+_RE_CLEAN = re.compile(r"^[\u4E00-\u9FFF]+\s+|【\s*【|】\s*】|\s+")
+
+
+def _clean_repl(m: "re.Match") -> str:
+    c = m.group(0)[0]
+    if c == "【":
+        return "【"
+    if c == "】":
+        return "】"
+    if "\u4E00" <= c <= "\u9FFF":
+        # Hán tự lẻ ở đầu dòng → bỏ
+        return ""
+    return " "
+
+# Số request đồng thời tối đa lên nguyendu (đừng đặt quá cao kẻo bị chặn)
+CONCURRENCY = 8
 
-def _call_nguyendu(text: str) -> str:
+# Giới hạn chủ động số request/giây để khỏi bị server chặn rồi phải retry
+RATE_PER_SEC = 8.0
+RATE_BURST = 8
+
+# Retry khi lỗi mạng/timeout: tối đa 3 lần, backoff 1s → 2s → 4s (trần 8s)
+MAX_RETRIES = 3
+
+
+class _TokenBucket:
     """
-    Gửi MỘT ĐOẠN chữ Hán lên hv_phienam_dtk.php, trả về HTML kết quả.
+    Token bucket đơn giản (đồng hồ monotonic, khóa thread-safe) để ghìm
+    throughput DƯỚI trần của server thay vì bắn hết tốc rồi ăn lỗi.
+    Dùng được cho cả đường sync (acquire) lẫn async (acquire_async).
     """
-    data = {
+
+    def __init__(self, rate_per_sec: float, burst: int):
+        self.rate = rate_per_sec
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _try_take(self) -> float:
+        """Lấy 1 token nếu có; trả về 0 nếu lấy được, ngược lại là số giây cần chờ."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+    def acquire(self) -> None:
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        while True:
+            wait = self._try_take()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+_BUCKET = _TokenBucket(RATE_PER_SEC, RATE_BURST)
+
+
+def _retry_delay(attempt: int) -> float:
+    """Backoff lũy thừa: 1s, 2s, 4s... trần 8s."""
+    return min(8.0, 2.0 ** attempt)
+
+# Session dùng chung cho đường sync: giữ kết nối (keep-alive) + pool,
+# khỏi phải bắt tay TCP / tra DNS lại cho từng request.
+_SESSION = requests.Session()
+_SESSION.headers.update({
+    "User-Agent": "Mozilla/5.0",
+    "Connection": "keep-alive",
+})
+_SESSION.mount(
+    "http://",
+    requests.adapters.HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0),
+)
+
+# ==============================
+#   CACHE PHIÊN ÂM TRÊN ĐĨA
+# ==============================
+
+# Kết quả phiên âm cho cùng một đoạn không bao giờ đổi → cache vĩnh viễn
+# trên đĩa, lần chạy sau (hoặc tên trùng lặp) khỏi phải gọi mạng.
+_CACHE_PATH = ".hanviet_cache.sqlite"
+
+# Commit theo lô để tránh fsync cho từng insert
+_CACHE_COMMIT_EVERY = 32
+
+_cache_lock = threading.Lock()
+_cache_conn: Optional[sqlite3.Connection] = None
+_cache_pending = 0
+
+
+def _cache_db() -> sqlite3.Connection:
+    global _cache_conn
+    if _cache_conn is None:
+        _cache_conn = sqlite3.connect(_CACHE_PATH, check_same_thread=False)
+        _cache_conn.execute(
+            "CREATE TABLE IF NOT EXISTS phienam (key TEXT PRIMARY KEY, value TEXT)"
+        )
+        _cache_conn.commit()
+    return _cache_conn
+
+
+def _cache_key(chunk: str) -> str:
+    return hashlib.sha1(chunk.encode("utf-8")).hexdigest()
+
+
+def _cache_get(chunk: str) -> Optional[str]:
+    with _cache_lock:
+        try:
+            row = _cache_db().execute(
+                "SELECT value FROM phienam WHERE key = ?", (_cache_key(chunk),)
+            ).fetchone()
+        except Exception:
+            return None
+    return row[0] if row else None
+
+
+def _cache_put(chunk: str, value: str) -> None:
+    global _cache_pending
+    with _cache_lock:
+        try:
+            db = _cache_db()
+            db.execute(
+                "INSERT OR REPLACE INTO phienam (key, value) VALUES (?, ?)",
+                (_cache_key(chunk), value),
+            )
+            _cache_pending += 1
+            if _cache_pending >= _CACHE_COMMIT_EVERY:
+                db.commit()
+                _cache_pending = 0
+        except Exception:
+            pass
+
+
+def _cache_flush() -> None:
+    global _cache_pending
+    with _cache_lock:
+        if _cache_conn is not None and _cache_pending:
+            try:
+                _cache_conn.commit()
+            except Exception:
+                pass
+            _cache_pending = 0
+
+
+# Có chữ Hán nào không (kể cả Extension A + Compatibility)?
+_RE_HAN = re.compile(r"[\u3400-\u4DBF\u4E00-\u9FFF\uF900-\uFAFF]")
+
+
+def has_han_chars(s: str) -> bool:
+    """Chuỗi có chứa ít nhất 1 Hán tự? Không có thì khỏi gửi lên nguyendu."""
+    return bool(_RE_HAN.search(s))
+
+
+def _build_payload(text: str) -> dict:
+    return {
         "choix": "2",          # 2 cột
         "choix_py": "4",       # Hán Việt
         "nbhanchar": "1000",   # mỗi đoạn <= 1000 Hán tự
@@ -20,16 +207,53 @@ def _call_nguyendu(text: str) -> str:
         "submit": "Go",
     }
 
-    resp = requests.post(
-        NGUYENDU_URL,
-        data=data,
-        timeout=2,
-        headers={"User-Agent": "Mozilla/5.0"},
-    )
-    # đảm bảo decode UTF-8
-    resp.encoding = "utf-8"
-    resp.raise_for_status()
-    return resp.text
+
+async def _call_nguyendu_async(session: "aiohttp.ClientSession", text: str) -> str:
+    """
+    Bản async của _call_nguyendu: gửi MỘT ĐOẠN chữ Hán qua session dùng chung
+    (keep-alive), trả về HTML kết quả.
+
+    Mỗi request phải lấy token từ _BUCKET trước khi bắn; lỗi mạng/timeout
+    thì retry với backoff lũy thừa.
+    """
+    last_err: Optional[Exception] = None
+    for attempt in range(MAX_RETRIES):
+        await _BUCKET.acquire_async()
+        try:
+            async with session.post(NGUYENDU_URL, data=_build_payload(text)) as resp:
+                resp.raise_for_status()
+                return await resp.text(encoding="utf-8")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            last_err = e
+            if attempt < MAX_RETRIES - 1:
+                await asyncio.sleep(_retry_delay(attempt))
+    raise last_err
+
+
+def _call_nguyendu(text: str) -> str:
+    """
+    Gửi MỘT ĐOẠN chữ Hán lên hv_phienam_dtk.php, trả về HTML kết quả.
+
+    Có token bucket + retry giống bản async.
+    """
+    last_err: Optional[Exception] = None
+    for attempt in range(MAX_RETRIES):
+        _BUCKET.acquire()
+        try:
+            resp = _SESSION.post(
+                NGUYENDU_URL,
+                data=_build_payload(text),
+                timeout=2,
+            )
+            # đảm bảo decode UTF-8
+            resp.encoding = "utf-8"
+            resp.raise_for_status()
+            return resp.text
+        except requests.RequestException as e:
+            last_err = e
+            if attempt < MAX_RETRIES - 1:
+                time.sleep(_retry_delay(attempt))
+    raise last_err
 
 
 def _parse_phienam_from_html(html: str) -> str:
@@ -44,13 +268,27 @@ def _parse_phienam_from_html(html: str) -> str:
       - html.unescape
       - xóa tag
       - nén khoảng trắng.
+
+    Có selectolax thì dùng (parse 1 lượt bằng C, nhanh hơn hẳn mấy lượt
+    regex trên body vài trăm KB); không có thì rơi về đường regex cũ.
     """
+    if _SelectolaxParser is not None:
+        tree = _SelectolaxParser(html)
+        nodes = tree.css("div.div-td-scrolls")
+        if nodes:
+            parts = []
+            for node in nodes:
+                seg = _RE_WS.sub(" ", node.text(separator=" ")).strip()
+                if seg:
+                    parts.append(seg)
+            return " ".join(parts)
+        # Trang đổi giao diện: lấy text cả body
+        if tree.body is not None:
+            return _RE_WS.sub(" ", tree.body.text(separator=" ")).strip()
+        return ""
+
     # Tìm tất cả các div có class = div-td-scrolls
-    blocks = re.findall(
-        r"<div[^>]+class=['\"]div-td-scrolls['\"][^>]*>(.*?)</div>",
-        html,
-        flags=re.S | re.I,
-    )
+    blocks = _RE_BLOCKS.findall(html)
 
     if blocks:
         parts = []
@@ -58,9 +296,9 @@ def _parse_phienam_from_html(html: str) -> str:
             # Giải mã entity như &#65292; -> ，
             seg = html_lib.unescape(b)
             # Xóa hết tag HTML bên trong (FONT, BR, v.v.)
-            seg = re.sub(r"<[^>]+>", "", seg)
+            seg = _RE_TAG.sub("", seg)
             # Nén khoảng trắng / loại bỏ xuống dòng nội bộ
-            seg = re.sub(r"\s+", " ", seg).strip()
+            seg = _RE_WS.sub(" ", seg).strip()
             if seg:
                 parts.append(seg)
 
@@ -68,12 +306,12 @@ def _parse_phienam_from_html(html: str) -> str:
         return " ".join(parts)
 
     # Fallback: nếu không tìm được div-td-scrolls (trang đổi giao diện)
-    m_body = re.search(r"<body[^>]*>(.*?)</body>", html, flags=re.S | re.I)
+    m_body = _RE_BODY.search(html)
     body = m_body.group(1) if m_body else html
-    body = re.sub(r"<script.*?</script>", "", body, flags=re.S | re.I)
-    body = re.sub(r"<style.*?</style>", "", body, flags=re.S | re.I)
-    text = re.sub(r"<[^>]+>", "", body)
-    text = re.sub(r"\s+", " ", text)
+    body = _RE_SCRIPT.sub("", body)
+    body = _RE_STYLE.sub("", body)
+    text = _RE_TAG.sub("", body)
+    text = _RE_WS.sub(" ", text)
     return text.strip()
 
 
@@ -85,20 +323,16 @@ def _clean_phienam_text(s: str) -> str:
     - Bỏ cụm ngoặc Hán đầu dòng: 【宋紀六十】 ...
     - Bỏ Hán tự đơn lẻ ở đầu dòng: 仁 nhân..., 九 cửu...
     - Khử một số duplicate như '【【' → '【', '】】' → '】'.
-    """
-    # Bỏ các xuống dòng nội bộ (giữa cùng một dòng logic)
-    s = s.replace("\r", " ").replace("\n", " ")
-    # Nén khoảng trắng
-    s = re.sub(r"\s+", " ", s).strip()
-
-    # Khử trường hợp hai dấu ngoặc liền nhau
-    s = re.sub(r"【\s*【", "【", s)
-    s = re.sub(r"】\s*】", "】", s)
 
+    Gộp thành 1 lượt translate + 1 lượt sub (thay vì 5-6 lượt, mỗi lượt
+    một chuỗi trung gian): _RE_CLEAN bắt cả 4 trường hợp, _clean_repl
+    quyết định thay bằng gì dựa trên ký tự đầu của match.
+    """
+    # Bỏ các xuống dòng / tab nội bộ (1 lượt, bảng tra C)
+    s = s.translate(_TRANS_WS)
 
-    # Nếu đầu dòng là 1 hoặc vài chữ Hán rồi tới khoảng trắng: 仁 nhân..., 九 cửu...
-    #    → bỏ phần Hán ở đầu, giữ lại phiên âm
-    s = re.sub(r"^[\u4E00-\u9FFF]+(\s+)", "", s)
+    # Nén khoảng trắng + khử ngoặc đôi + bỏ Hán tự đầu dòng trong 1 lượt
+    s = _RE_CLEAN.sub(_clean_repl, s)
 
     return s.strip()
 
@@ -128,12 +362,21 @@ def _lookup_line(line: str, max_chars: int = 1000, sleep_sec: float = 0.0) -> st
     if not line.strip():
         return ""
 
+    # Không có Hán tự (đã là latin, số, dấu câu...) → khỏi tốn round-trip
+    if not has_han_chars(line):
+        return line
+
     # Nếu đủ ngắn, gọi 1 lần
     if len(line) <= max_chars:
+        cached = _cache_get(line)
+        if cached is not None:
+            return cached
         try:
             html = _call_nguyendu(line)
             phienam = _parse_phienam_from_html(html)
             phienam = _clean_phienam_text(phienam)
+            _cache_put(line, phienam)
+            _cache_flush()
             return phienam
         except Exception as e:
             print(f"Lỗi khi gọi nguyendu cho dòng: {e}. Giữ nguyên dòng gốc.")
@@ -146,10 +389,15 @@ def _lookup_line(line: str, max_chars: int = 1000, sleep_sec: float = 0.0) -> st
     for idx, chunk in enumerate(chunks, 1):
         if not chunk.strip():
             continue
+        cached = _cache_get(chunk)
+        if cached is not None:
+            out_parts.append(cached)
+            continue
         try:
             html = _call_nguyendu(chunk)
             phienam = _parse_phienam_from_html(html)
             phienam = _clean_phienam_text(phienam)
+            _cache_put(chunk, phienam)
             out_parts.append(phienam)
             print(f"  Đã xử lý đoạn {idx}/{len(chunks)} của một dòng (độ dài {len(chunk)} ký tự).")
         except Exception as e:
@@ -159,14 +407,205 @@ def _lookup_line(line: str, max_chars: int = 1000, sleep_sec: float = 0.0) -> st
         if sleep_sec > 0:
             time.sleep(sleep_sec)
 
+    _cache_flush()
+
     # Ghép các phần lại thành 1 dòng duy nhất
     return " ".join(out_parts).strip()
 
 
+# Ký tự ngăn cách khi gộp nhiều dòng ngắn vào 1 request. Không phải Hán tự
+# nên nguyendu giữ nguyên; hiếm gặp nên không đụng hàng với nội dung.
+_BATCH_SEP = "⁂⁂⁂"
+
+
+def _pack_groups(
+    short_lines: List[Tuple[int, str]], max_chars: int
+) -> List[List[Tuple[int, str]]]:
+    """
+    Gộp các dòng ngắn LIÊN TIẾP thành từng nhóm sao cho tổng độ dài
+    (kể cả separator) không vượt max_chars → mỗi nhóm chỉ tốn 1 request.
+    """
+    groups: List[List[Tuple[int, str]]] = []
+    cur: List[Tuple[int, str]] = []
+    cur_len = 0
+    overhead = len(_BATCH_SEP) + 2  # separator + 2 khoảng trắng bao quanh
+
+    for idx, line in short_lines:
+        add = len(line) + (overhead if cur else 0)
+        if cur and cur_len + add > max_chars:
+            groups.append(cur)
+            cur, cur_len = [], 0
+            add = len(line)
+        cur.append((idx, line))
+        cur_len += add
+
+    if cur:
+        groups.append(cur)
+    return groups
+
+
+async def _run_lookup_async(input_lines: List[str], max_chars: int = 1000) -> List[str]:
+    """
+    Tra tất cả các đoạn ĐỒNG THỜI (tối đa CONCURRENCY request một lúc)
+    rồi ghép kết quả lại đúng thứ tự dòng/đoạn như input.
+
+    Dòng ngắn được gộp nhiều dòng vào 1 request (phân tách bằng _BATCH_SEP)
+    để tiết kiệm round-trip; nhóm nào tách kết quả không khớp số dòng thì
+    tự rơi về tra từng dòng.
+    """
+    line_results: Dict[int, str] = {}
+    long_jobs: List[Tuple[int, int, str]] = []   # (line_idx, chunk_idx, chunk)
+    short_lines: List[Tuple[int, str]] = []      # (line_idx, line)
+    dup_lines: Dict[int, int] = {}               # line_idx trùng -> line_idx đại diện
+    seen_short: Dict[str, int] = {}
+
+    for line_idx, raw in enumerate(input_lines):
+        line = raw.rstrip("\r\n")
+        if not line.strip():
+            continue
+        # Dòng không có Hán tự thì giữ nguyên, khỏi gửi đi
+        if not has_han_chars(line):
+            line_results[line_idx] = line
+            continue
+        cached = _cache_get(line)
+        if cached is not None:
+            line_results[line_idx] = cached
+            continue
+        if len(line) > max_chars:
+            for chunk_idx, chunk in enumerate(_split_by_length(line, max_chars=max_chars)):
+                if chunk.strip():
+                    long_jobs.append((line_idx, chunk_idx, chunk))
+        elif line in seen_short:
+            # Dòng lặp lại y hệt (điệp khúc, header...) → tra 1 lần thôi
+            dup_lines[line_idx] = seen_short[line]
+        else:
+            seen_short[line] = line_idx
+            short_lines.append((line_idx, line))
+
+    groups = _pack_groups(short_lines, max_chars)
+    chunk_results: Dict[Tuple[int, int], str] = {}
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    connector = aiohttp.TCPConnector(limit=CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(
+        connector=connector,
+        timeout=timeout,
+        headers={"User-Agent": "Mozilla/5.0"},
+    ) as session:
+
+        async def fetch(text: str) -> str:
+            async with sem:
+                html = await _call_nguyendu_async(session, text)
+            return _clean_phienam_text(_parse_phienam_from_html(html))
+
+        async def worker_chunk(line_idx: int, chunk_idx: int, chunk: str) -> None:
+            cached = _cache_get(chunk)
+            if cached is not None:
+                chunk_results[(line_idx, chunk_idx)] = cached
+                return
+            try:
+                phienam = await fetch(chunk)
+                _cache_put(chunk, phienam)
+            except Exception as e:
+                print(f"Lỗi khi gọi nguyendu cho đoạn (dòng {line_idx + 1}): {e}. Giữ nguyên đoạn gốc.")
+                phienam = chunk
+            chunk_results[(line_idx, chunk_idx)] = phienam
+
+        async def lookup_single(line_idx: int, line: str) -> None:
+            try:
+                phienam = await fetch(line)
+                _cache_put(line, phienam)
+            except Exception as e:
+                print(f"Lỗi khi gọi nguyendu cho dòng {line_idx + 1}: {e}. Giữ nguyên dòng gốc.")
+                phienam = line
+            line_results[line_idx] = phienam
+
+        async def worker_group(group: List[Tuple[int, str]]) -> None:
+            if len(group) == 1:
+                await lookup_single(*group[0])
+                return
+
+            joined = f" {_BATCH_SEP} ".join(line for _, line in group)
+            parts: Optional[List[str]] = None
+            try:
+                phienam = await fetch(joined)
+                # Làm sạch TỪNG phần sau khi tách: cleanup chạy trên cả
+                # batch chỉ xử lý được đầu chuỗi (vd Hán tự lẻ đầu dòng),
+                # các dòng sau separator vẫn còn nguyên rác nếu bỏ qua đây
+                parts = [_clean_phienam_text(p.strip()) for p in phienam.split(_BATCH_SEP)]
+            except Exception:
+                parts = None
+
+            if parts is not None and len(parts) == len(group):
+                for (line_idx, line), part in zip(group, parts):
+                    _cache_put(line, part)
+                    line_results[line_idx] = part
+                return
+
+            # Separator không về nguyên vẹn (hoặc lỗi mạng) → tra từng dòng
+            await asyncio.gather(*(lookup_single(i, l) for i, l in group))
+
+        await asyncio.gather(
+            *(worker_chunk(*job) for job in long_jobs),
+            *(worker_group(group) for group in groups),
+        )
+        _cache_flush()
+
+    # Điền kết quả cho các dòng trùng lặp từ dòng đại diện
+    for dup_idx, rep_idx in dup_lines.items():
+        line_results[dup_idx] = line_results.get(rep_idx, input_lines[dup_idx].rstrip("\r\n"))
+
+    # Ghép lại: dòng ngắn lấy thẳng kết quả; dòng dài ghép các đoạn theo chunk_idx
+    output_lines: List[str] = []
+    for line_idx, line in enumerate(input_lines):
+        if not line.strip():
+            output_lines.append("")
+            continue
+        if line_idx in line_results:
+            output_lines.append(line_results[line_idx])
+            continue
+        parts = [
+            chunk_results[key]
+            for key in sorted(k for k in chunk_results if k[0] == line_idx)
+        ]
+        output_lines.append(" ".join(p for p in parts if p).strip())
+
+    return output_lines
+
+
+def _run_lookup_threaded(input_lines: List[str], max_chars: int = 1000) -> List[str]:
+    """
+    Bản thread pool của _run_lookup_async (requests nhả GIL khi chờ socket
+    nên thread vẫn chạy song song tốt). Dùng khi không thể asyncio.run —
+    ví dụ caller đã ở trong một event loop đang chạy.
+    """
+    tasks = [(i, line) for i, line in enumerate(input_lines) if line.strip()]
+    output_lines = [""] * len(input_lines)
+
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
+        futures = {
+            ex.submit(_lookup_line, line, max_chars, 0.0): i
+            for i, line in tasks
+        }
+        for fut, i in futures.items():
+            try:
+                output_lines[i] = fut.result()
+            except Exception as e:
+                print(f"Lỗi khi tra dòng {i + 1}: {e}. Giữ nguyên dòng gốc.")
+                output_lines[i] = input_lines[i]
+
+    _cache_flush()
+    return output_lines
+
+
 def hvdic_lookup_long(text: str, max_chars: int = 1000, sleep_sec: float = 0.0) -> str:
     """
     Tra Hán-Việt cho CẢ ĐOẠN VĂN dài bằng hv_phienam_dtk.php.
 
+    Các đoạn được gửi đồng thời qua aiohttp (xem CONCURRENCY); đây vẫn là
+    hàm sync nên caller bên translator_bot không phải đổi gì.
+
     YÊU CẦU (đã đảm bảo):
     - Chỗ nào input xuống dòng → output xuống dòng y như vậy.
     - Không tự tiện thêm/bớt dòng trống.
@@ -177,39 +616,60 @@ def hvdic_lookup_long(text: str, max_chars: int = 1000, sleep_sec: float = 0.0)
         return ""
 
     input_lines = text.split("\n")
-    output_lines: List[str] = []
-
-    for line_idx, line in enumerate(input_lines, 1):
-        # Giữ nguyên dòng trống
-        if not line.strip():
-            output_lines.append("")
-            continue
-
-        out_line = _lookup_line(line, max_chars=max_chars, sleep_sec=sleep_sec)
-        output_lines.append(out_line)
+    try:
+        output_lines = asyncio.run(_run_lookup_async(input_lines, max_chars=max_chars))
+    except RuntimeError:
+        # Đang ở trong event loop (asyncio.run không dùng được) → thread pool
+        output_lines = _run_lookup_threaded(input_lines, max_chars=max_chars)
 
     # Ghép lại với đúng số dòng như input
     return "\n".join(output_lines)
 
 
-def process_file(input_path: str = "input.txt", output_path: str = "output.txt"):
+# Mỗi lô đọc/tra/ghi bao nhiêu dòng (đủ lớn để gộp + chạy song song hiệu quả,
+# đủ nhỏ để bộ nhớ không phụ thuộc kích thước file)
+_STREAM_BATCH_LINES = 200
+
+
+def _lookup_lines(input_lines: List[str], max_chars: int = 1000) -> List[str]:
+    """Tra một danh sách dòng qua đường async (hoặc thread pool nếu đang ở trong event loop)."""
     try:
-        with open(input_path, "r", encoding="utf-8") as f:
-            text = f.read()
-    except Exception as e:
-        print(f"Lỗi đọc {input_path}: {e}")
-        return
+        return asyncio.run(_run_lookup_async(input_lines, max_chars=max_chars))
+    except RuntimeError:
+        return _run_lookup_threaded(input_lines, max_chars=max_chars)
 
-    print("⏳ Đang tra Hán-Việt qua hv_phienam_dtk.php ...")
 
-    hv_text = hvdic_lookup_long(text)
+def iter_hvdic_lines(input_path: str, max_chars: int = 1000, batch_lines: int = _STREAM_BATCH_LINES):
+    """
+    Đọc file theo DÒNG, tra theo từng lô batch_lines dòng rồi yield từng dòng
+    Hán-Việt. Bộ nhớ chỉ tốn O(1 lô) thay vì O(cả file) → xử lý được file
+    lớn hơn RAM; số dòng (kể cả dòng trống) giữ nguyên như input.
+    """
+    buf: List[str] = []
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line in f:
+            buf.append(line.rstrip("\r\n"))
+            if len(buf) >= batch_lines:
+                yield from _lookup_lines(buf, max_chars=max_chars)
+                buf = []
+    if buf:
+        yield from _lookup_lines(buf, max_chars=max_chars)
+
+
+def process_file(input_path: str = "input.txt", output_path: str = "output.txt"):
+    print("⏳ Đang tra Hán-Việt qua hv_phienam_dtk.php ...")
 
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(hv_text)
+        with open(output_path, "w", encoding="utf-8") as out_f:
+            first = True
+            for hv_line in iter_hvdic_lines(input_path):
+                if not first:
+                    out_f.write("\n")
+                out_f.write(hv_line)
+                first = False
         print(f"✅ Hoàn tất! Đã ghi kết quả vào {output_path}")
-    except Exception as e:
-        print(f"Lỗi ghi {output_path}: {e}")
+    except OSError as e:
+        print(f"Lỗi đọc/ghi file: {e}")
 
 
 if __name__ == "__main__":
@@ -1,28 +1,141 @@
 # translator_backend.py
 
+import atexit
+import functools
+import logging
 import os
 import json
+import queue
 import re
+import sys
+import time
 import traceback
+from logging.handlers import QueueHandler, QueueListener
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from collections import OrderedDict
 from typing import List, Optional, Dict
 
+import asyncio
+import hashlib
+import pickle
+import random
+import threading
+import weakref
+
+import httpx
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, OpenAI, RateLimitError
+
+# orjson (C) parse/dump JSON nhanh hơn stdlib vài lần; không có thì dùng json thường
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# tiktoken để chia chunk theo token thật thay vì đếm ký tự; không có thì
+# quay về ngưỡng ký tự như cũ
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
 
-from search_hanzi import hvdic_lookup_long
+from search_hanzi import has_han_chars, hvdic_lookup_long
 
 
 # ==============================
 #       LOAD ENV + CLIENT
 # ==============================
 
+# .env đọc ngay lúc import (rẻ — chỉ là parse file nhỏ): các knob
+# MAX_CONCURRENCY, MODEL_NAME_SMALL, TRANSLATE_CACHE... bên dưới đều đọc
+# os.getenv ở mức module nên .env phải vào environ TRƯỚC. Chỉ phần đắt
+# (dựng client + pool httpx) mới để lười.
 load_dotenv()
 
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY not found in .env")
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# Client khởi tạo LƯỜI (lần gọi API đầu tiên mới dựng): import module từ
+# web server / worker process không phải trả tiền dựng pool httpx nếu
+# chưa dịch gì. functools.cache đảm bảo mỗi process đúng 1 client.
+
+@functools.cache
+def _api_key() -> str:
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("OPENAI_API_KEY not found in .env")
+    return api_key
+
+
+@functools.cache
+def get_client() -> OpenAI:
+    # Pool kết nối lớn hơn mặc định + HTTP/2 (multiplex nhiều request trên 1
+    # kết nối) để 8+ luồng dịch song song không phải chờ nhau bắt tay TCP/TLS
+    c = OpenAI(
+        api_key=_api_key(),
+        http_client=httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+            timeout=httpx.Timeout(120.0),
+        ),
+    )
+    # Đóng pool kết nối tử tế khi thoát (FIN/GOAWAY thay vì để OS reset)
+    atexit.register(c.close)
+    return c
+
+
+# Client async cho đường dịch song song, cache THEO event loop chứ không
+# theo process: mỗi asyncio.run dựng loop mới, kết nối keep-alive mở dưới
+# loop cũ (đã đóng) dùng lại sẽ nổ "Event loop is closed". WeakKey để
+# loop chết thì entry tự biến mất
+_async_clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_client() -> AsyncOpenAI:
+    loop = asyncio.get_running_loop()
+    c = _async_clients.get(loop)
+    if c is None:
+        c = AsyncOpenAI(
+            api_key=_api_key(),
+            http_client=httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                timeout=httpx.Timeout(120.0),
+            ),
+        )
+        _async_clients[loop] = c
+    return c
+
+
+async def _close_async_client() -> None:
+    # Đóng client của loop hiện tại — gọi ở cuối mỗi scope asyncio.run để
+    # pool không bị bỏ rơi khi loop đóng
+    c = _async_clients.pop(asyncio.get_running_loop(), None)
+    if c is not None:
+        await c.close()
+
+# Log tiến độ qua QueueHandler → QueueListener: đường dịch nóng (worker
+# async, thread pool) chỉ bỏ message vào queue, thread nền mới format +
+# ghi stdout, nên print không còn chặn event loop. Format giữ nguyên như
+# print cũ; các prompt tương tác trong main() vẫn dùng print thẳng để
+# không đảo thứ tự với input()
+_log_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter("%(message)s"))
+_log_listener = QueueListener(_log_queue, _log_handler)
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+logger = logging.getLogger("translator")
+logger.setLevel(logging.INFO)
+logger.addHandler(QueueHandler(_log_queue))
+logger.propagate = False
+
+# Số chunk dịch đồng thời tối đa (giữ dưới rate limit RPM/TPM của account)
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "8"))
+
+# Lỗi tạm thời đáng retry (429 / đứt kết nối / timeout); backoff mũ + jitter
+_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError)
+TRANSLATE_MAX_ATTEMPTS = 6
 
 # Main translation model
 MODEL_NAME = "gpt-5.2"
@@ -30,9 +143,45 @@ MODEL_NAME = "gpt-5.2"
 # Model used for extraction (cheap + stable)
 MODEL_EXTRACT = "gpt-4o"
 
+# Model rẻ/nhanh hơn cho chunk ngắn (vd: MODEL_NAME_SMALL=gpt-4o-mini);
+# để trống thì mọi chunk đều dùng MODEL_NAME như cũ
+MODEL_NAME_SMALL = os.getenv("MODEL_NAME_SMALL", "")
+SMALL_MODEL_MAX_CHARS = 1500
+
+
+def _model_for_chunk(chunk: str) -> str:
+    if MODEL_NAME_SMALL and len(chunk) <= SMALL_MODEL_MAX_CHARS:
+        return MODEL_NAME_SMALL
+    return MODEL_NAME
+
+
+# Trần token output = tỉ lệ này × token input + 128. Decode chạy tuyến tính
+# theo độ dài output nên một reply lan man kéo đuôi latency cả job; trần
+# chặn ca đó lại. Tiếng Việt tốn token hơn Hán văn ~2-3 lần nên tỉ lệ để
+# rộng tay 3.0 (chỉnh qua env nếu cặp ngôn ngữ khác)
+OUTPUT_TOKEN_RATIO = float(os.getenv("OUTPUT_TOKEN_RATIO", "3.0"))
+
+# Trần cứng cho max_tokens: vượt giới hạn completion của model (16384 với
+# lớp gpt-4o) thì API trả 400 thẳng thừng — lưới an toàn mà thành lỗi cứng
+MAX_COMPLETION_TOKENS = int(os.getenv("MAX_COMPLETION_TOKENS", "16384"))
+
+
+def _max_tokens_for(chunk: str) -> int:
+    enc = _token_encoder()
+    if enc is not None:
+        n_in = len(enc.encode(chunk))
+    else:
+        # Không có tiktoken: ước lượng kiểu CJK ~1 token/ký tự (dư cho
+        # Latin nhưng trần chỉ là lưới an toàn, không cần sát)
+        n_in = max(1, len(chunk))
+    return min(int(n_in * OUTPUT_TOKEN_RATIO) + 128, MAX_COMPLETION_TOKENS)
+
 # Default translation mode: "smooth" | "literal"
 DEFAULT_MODE = "smooth"
 
+# Input ngắn hơn ngưỡng này thì gộp trích tên + dịch vào MỘT lần gọi LLM
+SMALL_COMBINED_MAX_CHARS = 4000
+
 # Directory where external prompt files are stored
 PROMPT_DIR = "prompts"
 
@@ -44,22 +193,63 @@ GLOSSARY_PATH = "glossary.json"
 #        SMALL UTILITIES
 # ==============================
 
+# Precompiled regexes (these helpers run once per token/name, so compile
+# the patterns a single time at import instead of per call)
+_RE_WS = re.compile(r"\s+")
+_RE_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$", re.IGNORECASE)
+_RE_SPACE_SPLIT = re.compile(r"(\s+)")
+
+# Bảng ký tự "chữ" cho vi_proper_case: ASCII + dải Latin có dấu (À..ỹ).
+# Tra set nhanh hơn hẳn chạy regex cho từng sub-token; ký tự lạ ngoài bảng
+# thì hỏi lại str.isalnum (đúng ngữ nghĩa \w của re.UNICODE).
+_VI_WORDCHARS = frozenset(
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_"
+    + "".join(chr(cp) for cp in range(0x00C0, 0x1EFA) if chr(cp).isalnum())
+)
+
+def _is_word_char(c: str) -> bool:
+    return c in _VI_WORDCHARS or c.isalnum()
+_RE_BULLET = re.compile(r"^(?:[-•*]+)\s*")
+_RE_NUMBERING = re.compile(r"^\d+[\).\-\s]+")
+_RE_CJK_PUNCT = re.compile(r"[，。；;,:]")
+
 def normalize_key(s: str) -> str:
     """Normalize keys to avoid re-asking due to spaces/newlines."""
-    return re.sub(r"\s+", "", str(s or ""))
+    return _RE_WS.sub("", str(s or ""))
 
 def strip_code_fence(s: str) -> str:
-    return re.sub(r"^```(?:json)?\s*|\s*```$", "", s.strip(), flags=re.IGNORECASE)
+    return _RE_CODE_FENCE.sub("", s.strip())
+
+def _json_loads(s: str):
+    if orjson is not None:
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # orjson khắt khe hơn stdlib (từ chối NaN/Infinity, số nguyên
+            # quá 64-bit...) — rơi về json.loads để giữ đường salvage cho
+            # JSON lỏng lẻo mà model thỉnh thoảng nhả ra
+            return json.loads(s)
+    return json.loads(s)
+
+def _json_dumps_pretty(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False, indent=2)
+
+def _json_dumps_compact(data) -> str:
+    if orjson is not None:
+        return orjson.dumps(data).decode("utf-8")
+    return json.dumps(data, ensure_ascii=False)
 
 def safe_json_extract_first_object(text: str) -> Optional[dict]:
     """
     Try to parse JSON from text:
-    - direct json.loads
+    - direct loads (orjson when available)
     - otherwise extract first {...} block and parse
     """
     t = strip_code_fence(text)
     try:
-        return json.loads(t)
+        return _json_loads(t)
     except Exception:
         pass
 
@@ -68,7 +258,7 @@ def safe_json_extract_first_object(text: str) -> Optional[dict]:
     if first != -1 and last != -1 and last > first:
         cand = t[first:last + 1]
         try:
-            return json.loads(cand)
+            return _json_loads(cand)
         except Exception:
             return None
     return None
@@ -85,14 +275,14 @@ def vi_proper_case(s: str) -> str:
         return ""
 
     # Split by spaces but preserve punctuation inside token
-    parts = re.split(r"(\s+)", s)
+    parts = _RE_SPACE_SPLIT.split(s)
 
     def cap_token(tok: str) -> str:
         if not tok or tok.isspace():
             return tok
 
         # If token is purely punctuation
-        if re.fullmatch(r"[^\wÀ-ỹ]+", tok, flags=re.UNICODE):
+        if not any(_is_word_char(c) for c in tok):
             return tok
 
         # Handle hyphenated words: "gia-luat" -> "Gia-Luat"
@@ -103,15 +293,23 @@ def vi_proper_case(s: str) -> str:
                 out_sub.append(sp)
                 continue
 
-            # Preserve leading/trailing punctuation around word
-            m = re.match(r"^([^\wÀ-ỹ]*)([\wÀ-ỹ]+)([^\wÀ-ỹ]*)$", sp, flags=re.UNICODE)
-            if not m:
+            # Find the word core by scanning off leading/trailing punctuation
+            n = len(sp)
+            a = 0
+            while a < n and not _is_word_char(sp[a]):
+                a += 1
+            b = n
+            while b > a and not _is_word_char(sp[b - 1]):
+                b -= 1
+
+            core = sp[a:b]
+            if not core or not all(_is_word_char(c) for c in core):
+                # punctuation inside the core → same fallback as before
                 out_sub.append(sp[:1].upper() + sp[1:])
                 continue
 
-            lead, core, tail = m.group(1), m.group(2), m.group(3)
             core2 = core[:1].upper() + core[1:].lower() if len(core) > 1 else core.upper()
-            out_sub.append(lead + core2 + tail)
+            out_sub.append(sp[:a] + core2 + sp[b:])
 
         return "-".join(out_sub)
 
@@ -122,21 +320,28 @@ def vi_proper_case(s: str) -> str:
 #          PROMPT LOADING
 # ==============================
 
+@functools.lru_cache(maxsize=64)
 def load_prompt_file(filename: str) -> str:
+    # Cached: translate_chunk asks for the same files on every chunk, the
+    # content doesn't change mid-run. (Edit prompts while running? call
+    # load_prompt_file.cache_clear().)
     path = os.path.join(PROMPT_DIR, filename)
     if not os.path.exists(path):
         raise FileNotFoundError(f"Prompt file not found: {path}. Please create it.")
     with open(path, "r", encoding="utf-8") as f:
         return f.read()
 
+@functools.lru_cache(maxsize=32)
 def load_system_prompt(source_lang: str, mode: str) -> str:
     filename = f"system_{source_lang}_{mode}.txt"
     return load_prompt_file(filename)
 
+@functools.lru_cache(maxsize=32)
 def load_assistant_prompt(source_lang: str, mode: str) -> str:
     filename = f"assistant_{source_lang}_{mode}.txt"
     return load_prompt_file(filename)
 
+@functools.lru_cache(maxsize=32)
 def load_intro_prompt(source_lang: str) -> str:
     if source_lang == "auto":
         return load_prompt_file("intro_auto.txt")
@@ -144,25 +349,136 @@ def load_intro_prompt(source_lang: str) -> str:
     return load_prompt_file(filename)
 
 
+def preload_default_prompts() -> None:
+    # Làm nóng cache cho cặp (zh, smooth) mặc định — đọc file trước khi
+    # chunk đầu tiên cần tới; thiếu file prompt thì để lỗi nổ ra lúc dùng
+    # thật. Gọi từ _warmup_client của CLI chứ không chạy lúc import, để
+    # import module từ server không đụng filesystem
+    try:
+        load_system_prompt("zh", DEFAULT_MODE)
+        load_assistant_prompt("zh", DEFAULT_MODE)
+        load_intro_prompt("zh")
+    except FileNotFoundError:
+        pass
+
+
 # ==============================
 #     SPLIT TEXT TO CHUNKS
 # ==============================
 
+# Ranh giới câu — chỉ dùng khi một đoạn văn đơn lẻ đã dài quá max_chars,
+# để không cắt giữa câu. Dấu CJK (。！？) tách NGAY sau dấu, không đòi
+# khoảng trắng vì Hán văn không bao giờ có space sau câu; dấu Latin (.!?)
+# vẫn đòi whitespace theo sau để không cắt số thập phân / viết tắt. Cả 2
+# nhánh đều zero-width (không nuốt ký tự nào) nên ghép các mảnh lại bằng
+# "".join là ra đúng nguyên văn
+_RE_SENT_BOUNDARY = re.compile(r"(?<=[。！？])|(?<=[.!?])(?=\s)")
+
+# Đuôi chunk trước được gửi kèm chunk sau làm ngữ cảnh (không dịch lại)
+CONTEXT_OVERLAP_CHARS = 200
+
+# Ngân sách token mỗi chunk khi đo được bằng tiktoken; không có tiktoken
+# thì quay về ngưỡng ký tự max_chars. Đặt ngang ngưỡng ký tự cũ quy ra
+# token Hán văn (1 chữ Hán ≈ 1 token cl100k → 6000 ký tự ≈ 6000 token) để
+# workload chính (Hán văn) không bị băm NHỎ HƠN trước; văn Latin (~4 ký
+# tự/token) thì gom được chunk to hơn hẳn → ít call hơn
+MAX_CHUNK_TOKENS = 6000
+
+
+@functools.lru_cache(maxsize=1)
+def _token_encoder():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(MODEL_NAME)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def _hard_cut(sent: str, budget: int, measure) -> int:
+    """Điểm cắt (số ký tự) để sent[:cut] vừa lọt budget theo measure."""
+    cut = max(1, len(sent) * budget // max(1, measure(sent)))
+    while cut > 1 and measure(sent[:cut]) > budget:
+        cut = max(1, cut * 9 // 10)
+    return cut
+
+
+def _split_long_paragraph(para: str, budget: int, measure) -> List[str]:
+    """Cắt đoạn văn quá dài theo ranh giới câu, gom tham lam tới budget."""
+    pieces: List[str] = []
+    buf: List[str] = []
+    buf_len = 0
+    for sent in _RE_SENT_BOUNDARY.split(para):
+        # Câu đơn lẻ vẫn dài quá thì đành cắt cứng theo độ dài
+        while measure(sent) > budget:
+            if buf:
+                pieces.append("".join(buf))
+                buf, buf_len = [], 0
+            cut = _hard_cut(sent, budget, measure)
+            pieces.append(sent[:cut])
+            sent = sent[cut:]
+        if buf_len + measure(sent) > budget and buf:
+            pieces.append("".join(buf))
+            buf, buf_len = [], 0
+        if sent:
+            buf.append(sent)
+            buf_len += measure(sent)
+    if buf:
+        pieces.append("".join(buf))
+    return pieces
+
+
 def split_text_to_chunks(text: str, max_chars: int = 6000) -> List[str]:
+    # Có tiktoken thì đo bằng token thật: 1 chữ Hán ≈ 1 token nhưng 4 ký
+    # tự Latin ≈ 1 token, nên ngưỡng ký tự làm văn CJK bị băm quá vụn còn
+    # văn Latin lại sát trần. Đo token gom được chunk to hơn → ít call hơn
+    enc = _token_encoder()
+    if enc is not None:
+        budget = MAX_CHUNK_TOKENS
+        measure = lambda s: len(enc.encode(s))
+    else:
+        budget = max_chars
+        measure = len
+
     paragraphs = text.split("\n\n")
     chunks: List[str] = []
-    current = ""
+    # Accumulate paragraphs in a list + running length and join once per
+    # chunk; repeated `current + para` would copy the whole buffer each time
+    buf: List[str] = []
+    buf_len = 0
+
+    def flush() -> None:
+        nonlocal buf, buf_len
+        chunk = "\n\n".join(buf).strip()
+        if chunk:
+            chunks.append(chunk)
+        buf = []
+        buf_len = 0
 
     for para in paragraphs:
-        if len(current) + len(para) + 2 <= max_chars:
-            current = (current + "\n\n" + para) if current else para
+        para_len = measure(para) if para else 0
+        if para_len > budget:
+            # Đoạn văn một mình đã quá dài → cắt theo câu thay vì để
+            # nguyên một chunk khổng lồ cắt giữa câu ở lần dịch
+            flush()
+            for piece in _split_long_paragraph(para, budget, measure):
+                chunks.append(piece)
+            continue
+        if buf_len + para_len + 2 <= budget:
+            if buf:
+                buf.append(para)
+                buf_len += para_len + 2
+            elif para:
+                buf = [para]
+                buf_len = para_len
+            # both empty: nothing to accumulate
         else:
-            if current.strip():
-                chunks.append(current.strip())
-            current = para
+            flush()
+            if para:
+                buf = [para]
+                buf_len = para_len
 
-    if current.strip():
-        chunks.append(current.strip())
+    flush()
 
     return chunks
 
@@ -205,25 +521,45 @@ Text:
 {text}
 """.strip()
 
-    resp = client.chat.completions.create(
+    # Structured Outputs: API tự ép kết quả đúng schema nên không còn cần
+    # 3 tầng regex salvage như trước
+    resp = get_client().chat.completions.create(
         model=MODEL_EXTRACT,
         temperature=0.0,
         messages=[
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt},
         ],
+        response_format={
+            "type": "json_schema",
+            "json_schema": {
+                "name": "proper_nouns",
+                "strict": True,
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "items": {
+                            "type": "array",
+                            "items": {"type": "string", "maxLength": 100},
+                            "maxItems": max_items,
+                        },
+                    },
+                    "required": ["items"],
+                    "additionalProperties": False,
+                },
+            },
+        },
     )
 
     raw = (resp.choices[0].message.content or "").strip()
-    raw = strip_code_fence(raw)
 
     # ---------- helpers ----------
     def clean_item(x: str) -> str:
         x = str(x).replace("\r", " ").replace("\n", " ").strip()
-        x = re.sub(r"\s+", " ", x)
+        x = _RE_WS.sub(" ", x)
         # strip common bullets / numbering
-        x = re.sub(r"^(?:[-•*]+)\s*", "", x)
-        x = re.sub(r"^\d+[\).\-\s]+", "", x)
+        x = _RE_BULLET.sub("", x)
+        x = _RE_NUMBERING.sub("", x)
         # strip wrapping quotes if any
         if (x.startswith('"') and x.endswith('"')) or (x.startswith("'") and x.endswith("'")):
             x = x[1:-1].strip()
@@ -240,7 +576,7 @@ Text:
         if x.lower().startswith(("items:", "json", "output", "schema")):
             return True
         # loại các dòng quá “câu văn” (nhiều dấu câu)
-        if len(re.findall(r"[，。；;,:]", x)) >= 3:
+        if len(_RE_CJK_PUNCT.findall(x)) >= 3:
             return True
         return False
 
@@ -259,22 +595,11 @@ Text:
                 break
         return out
 
-    # ---------- parse layer 1: strict json ----------
+    # Schema được enforce phía API → parse thẳng; guard mỏng phòng reply rỗng/refusal
     data = safe_json_extract_first_object(raw)
     if isinstance(data, dict) and isinstance(data.get("items"), list):
         return dedupe_strong(data["items"])
-
-    # ---------- parse layer 2: try to find "items": [...] and parse that list ----------
-    m = re.search(r'"items"\s*:\s*\[(.*?)\]', raw, flags=re.DOTALL)
-    if m:
-        cand = '{"items":[' + m.group(1) + ']}'
-        data2 = safe_json_extract_first_object(cand)
-        if isinstance(data2, dict) and isinstance(data2.get("items"), list):
-            return dedupe_strong(data2["items"])
-
-    # ---------- fallback: split raw by separators (last resort) ----------
-    rough = re.split(r'[\n,，、;；]+', raw)
-    return dedupe_strong(rough)
+    return []
 
 # ==============================
 #        GLOSSARY I/O
@@ -284,7 +609,7 @@ def load_glossary(path: str) -> Dict[str, str]:
     if not os.path.exists(path):
         return {}
     with open(path, "r", encoding="utf-8") as f:
-        data = json.load(f)
+        data = _json_loads(f.read())
     if not isinstance(data, dict):
         return {}
     # Ensure all values are strings
@@ -292,7 +617,7 @@ def load_glossary(path: str) -> Dict[str, str]:
 
 def save_glossary(path: str, glossary: Dict[str, str]) -> None:
     with open(path, "w", encoding="utf-8") as f:
-        json.dump(glossary, f, ensure_ascii=False, indent=2)
+        f.write(_json_dumps_pretty(glossary))
 
 
 # ==============================
@@ -305,11 +630,13 @@ def build_glossary_from_hvdic(
     existing: Optional[Dict[str, str]] = None,
     print_result: bool = True,
     max_len: int = 80,
+    max_workers: int = 8,
 ) -> Dict[str, str]:
     """
     Auto-build mapping using hvdic_lookup_long.
     - Only lookup each missing item once (caller passes missing list; this also double-checks existing).
-    - Print lookup results to console so you can verify.
+    - Lookups run on a bounded thread pool (network-bound) → results are
+      printed as they complete, not in input order.
     - Proper-case output (Triệu Khuông Dận, Yên Kinh, Trung thư thị lang...)
     - Skip too-long strings to avoid tool errors.
     """
@@ -320,46 +647,64 @@ def build_glossary_from_hvdic(
     if total == 0:
         return out
 
-    print(f"📚 Tra Hán–Việt bằng hvdic cho {total} mục (mỗi mục 1 lần)...")
+    logger.info(f"📚 Tra Hán–Việt bằng hvdic cho {total} mục (mỗi mục 1 lần, {max_workers} luồng)...")
 
+    # Lọc trước: chỉ submit những mục thật sự cần tra
+    to_lookup: List[tuple] = []
+    seen_keys = set()
     for i, n in enumerate(names, 1):
         key = str(n).replace("\r", " ").replace("\n", " ").strip()
         if not key:
             continue
 
         # Nếu đã có trong glossary thì bỏ qua (đảm bảo không tra lại)
-        if key in existing or key in out:
+        if key in existing or key in seen_keys:
             if print_result:
-                print(f"⏭️  [{i}/{total}] (đã có) {key} -> {existing.get(key) or out.get(key)}")
+                logger.info(f"⏭️  [{i}/{total}] (đã có) {key} -> {existing.get(key, '')}")
             continue
 
         # Chặn các cụm "quá dài" (thường là do extract nhầm, không phải tên riêng)
         if len(key) > max_len:
             if print_result:
-                print(f"⚠️  [{i}/{total}] BỎ QUA (quá dài {len(key)}): {key[:50]}...")
+                logger.info(f"⚠️  [{i}/{total}] BỎ QUA (quá dài {len(key)}): {key[:50]}...")
             continue
 
-        try:
-            hv_raw = hvdic_lookup_long(key)
-        except Exception as e:
-            hv_raw = None
+        # Không có Hán tự thì hvdic cũng chẳng tra được gì → khỏi gọi mạng
+        if not has_han_chars(key):
+            if print_result:
+                logger.info(f"⏭️  [{i}/{total}] BỎ QUA (không có Hán tự): {key}")
+            continue
 
-        hv = vi_proper_case(hv_raw) if hv_raw else ""
+        seen_keys.add(key)
+        to_lookup.append((i, key))
 
-        # Lọc nhiễu phổ biến của tool (phòng trường hợp tool trả về trang lỗi)
-        bad_markers = ["Lightgoldenrodyellow", "Viewport", "Quá Giới Hạn", "timchu", "phienam"]
-        if any(m.lower() in hv.lower() for m in bad_markers):
-            hv = ""
+    # Lọc nhiễu phổ biến của tool (phòng trường hợp tool trả về trang lỗi)
+    bad_markers = ["Lightgoldenrodyellow", "Viewport", "Quá Giới Hạn", "timchu", "phienam"]
 
-        if hv:
-            out[key] = hv
-            if print_result:
-                print(f"🔎 [{i}/{total}] {key} -> {hv}")
-        else:
-            if print_result:
-                print(f"❌ [{i}/{total}] {key} -> (không ra)")
+    if to_lookup:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(to_lookup))) as ex:
+            futures = {ex.submit(hvdic_lookup_long, key): (i, key) for i, key in to_lookup}
+            for fut in as_completed(futures):
+                i, key = futures[fut]
+                try:
+                    hv_raw = fut.result()
+                except Exception:
+                    hv_raw = None
 
-    print(f"✅ Tra xong: lấy được {len(out)}/{total} mục.\n")
+                hv = vi_proper_case(hv_raw) if hv_raw else ""
+
+                if any(m.lower() in hv.lower() for m in bad_markers):
+                    hv = ""
+
+                if hv:
+                    out[key] = hv
+                    if print_result:
+                        logger.info(f"🔎 [{i}/{total}] {key} -> {hv}")
+                else:
+                    if print_result:
+                        logger.info(f"❌ [{i}/{total}] {key} -> (không ra)")
+
+    logger.info(f"✅ Tra xong: lấy được {len(out)}/{total} mục.\n")
     return out
 
 
@@ -385,23 +730,454 @@ def build_glossary_interactively(names: List[str]) -> Dict[str, str]:
 #      TRANSLATION CALL
 # ==============================
 
+# Cache bản dịch trên đĩa: temperature=0 nên cùng một bộ messages → cùng
+# một kết quả; bật bằng TRANSLATE_CACHE=1 (hữu ích khi chạy đi chạy lại
+# lúc chỉnh prompt/glossary — hit cache là khỏi tốn token lẫn thời gian).
+TRANSLATE_CACHE_DIR = "cache"
+TRANSLATE_CACHE_ENABLED = os.getenv("TRANSLATE_CACHE", "") == "1"
+
+
+def _translate_cache_key(messages: List[dict], model: str = None) -> str:
+    payload = json.dumps(
+        {"model": model or MODEL_NAME, "msgs": messages, "t": 0.0},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _translate_cache_get(key: str) -> Optional[str]:
+    path = os.path.join(TRANSLATE_CACHE_DIR, f"{key}.txt")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    return None
+
+
+def _translate_cache_put(key: str, text: str) -> None:
+    os.makedirs(TRANSLATE_CACHE_DIR, exist_ok=True)
+    path = os.path.join(TRANSLATE_CACHE_DIR, f"{key}.txt")
+    # Ghi ra file tạm rồi rename để không bao giờ đọc phải file ghi dở
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# LRU trong RAM trên cùng key với cache đĩa: hit không tốn syscall nào —
+# đáng kể khi module được bọc trong server chạy dài (FastAPI...) và cùng
+# một chunk được hỏi đi hỏi lại trong một process. Luôn bật (rẻ, an toàn)
+_MEM_CACHE_MAX = 1024
+_mem_cache: "OrderedDict[str, str]" = OrderedDict()
+_mem_cache_lock = threading.Lock()
+
+
+def _mem_cache_get(key: str) -> Optional[str]:
+    with _mem_cache_lock:
+        if key in _mem_cache:
+            _mem_cache.move_to_end(key)
+            return _mem_cache[key]
+    return None
+
+
+def _mem_cache_put(key: str, text: str) -> None:
+    with _mem_cache_lock:
+        _mem_cache[key] = text
+        _mem_cache.move_to_end(key)
+        while len(_mem_cache) > _MEM_CACHE_MAX:
+            _mem_cache.popitem(last=False)
+
+
+# Cache NGỮ NGHĨA (tùy chọn, SEMANTIC_CACHE=1): đoạn gần-trùng (điệp khúc,
+# câu lặp lại với khác biệt nhỏ) vẫn dùng lại bản dịch cũ nếu cosine
+# similarity của embedding ≥ ngưỡng. Cần faiss + numpy; embedding tốn một
+# khoản nhỏ nên mặc định tắt.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "") == "1"
+SEMANTIC_CACHE_PATH = os.path.join(TRANSLATE_CACHE_DIR, "semantic_cache.pkl")
+SEMANTIC_SIM_THRESHOLD = 0.95
+EMBED_MODEL = "text-embedding-3-small"
+
+# Index tách riêng theo (source_lang, mode): cùng một câu nguồn nhưng dịch
+# literal vs smooth (hay khai báo ngôn ngữ khác) là bản dịch KHÁC nhau,
+# không được trả chéo cho nhau
+_sem_lock = threading.Lock()
+_sem_indexes: Dict[tuple, object] = {}          # (lang, mode) -> faiss.IndexFlatIP
+_sem_translations: Dict[tuple, List[str]] = {}  # (lang, mode) -> bản dịch theo id
+_sem_loaded = False
+
+
+def _semantic_cache_init() -> None:
+    """Nạp cache từ đĩa (1 lần); gọi khi đã giữ _sem_lock."""
+    global _sem_loaded
+    if _sem_loaded:
+        return
+    import faiss
+    import numpy as np
+
+    _sem_loaded = True
+    if not os.path.exists(SEMANTIC_CACHE_PATH):
+        return
+    try:
+        with open(SEMANTIC_CACHE_PATH, "rb") as f:
+            data = pickle.load(f)
+        # File định dạng cũ (chưa phân vùng) bỏ qua luôn — không biết nó
+        # thuộc (lang, mode) nào nên không dám dùng
+        if not isinstance(data, dict):
+            logger.info("⚠️  Semantic cache định dạng cũ (không phân vùng lang/mode), bỏ qua.")
+            return
+        for part_key, (vectors, translations) in data.items():
+            if len(translations):
+                arr = np.asarray(vectors, dtype="float32")
+                index = faiss.IndexFlatIP(arr.shape[1])
+                index.add(arr)
+                _sem_indexes[part_key] = index
+                _sem_translations[part_key] = list(translations)
+    except Exception as e:
+        logger.info(f"⚠️  Không đọc được semantic cache ({e}), bỏ qua.")
+
+
+def _embed_chunk(chunk: str):
+    import numpy as np
+
+    resp = get_client().embeddings.create(model=EMBED_MODEL, input=chunk)
+    v = np.asarray(resp.data[0].embedding, dtype="float32")
+    norm = float(np.linalg.norm(v))
+    if norm > 0:
+        v /= norm
+    return v
+
+
+def _semantic_cache_lookup(chunk: str, source_lang: str, mode: str):
+    """Trả về (bản dịch hoặc None, embedding) — embedding dùng lại khi add."""
+    with _sem_lock:
+        _semantic_cache_init()
+    vec = _embed_chunk(chunk)
+    part_key = (source_lang, mode)
+    with _sem_lock:
+        index = _sem_indexes.get(part_key)
+        if index is not None and index.ntotal:
+            scores, ids = index.search(vec.reshape(1, -1), 1)
+            if scores[0][0] >= SEMANTIC_SIM_THRESHOLD:
+                return _sem_translations[part_key][ids[0][0]], vec
+    return None, vec
+
+
+def _semantic_cache_add(source_lang: str, mode: str, vec, translation: str) -> None:
+    import faiss
+
+    part_key = (source_lang, mode)
+    with _sem_lock:
+        index = _sem_indexes.get(part_key)
+        if index is None:
+            index = faiss.IndexFlatIP(vec.shape[0])
+            _sem_indexes[part_key] = index
+            _sem_translations[part_key] = []
+        index.add(vec.reshape(1, -1))
+        _sem_translations[part_key].append(translation)
+
+        os.makedirs(TRANSLATE_CACHE_DIR, exist_ok=True)
+        data = {
+            k: (idx.reconstruct_n(0, idx.ntotal), list(_sem_translations[k]))
+            for k, idx in _sem_indexes.items()
+        }
+        tmp_path = f"{SEMANTIC_CACHE_PATH}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(data, f)
+        os.replace(tmp_path, SEMANTIC_CACHE_PATH)
+
+
+@functools.lru_cache(maxsize=4)
+def _render_glossary_items(items: tuple) -> str:
+    lines = ["=== GLOSSARY (THAM KHẢO, HOA/THƯỜNG tùy theo hoàn cảnh mà sửa đổi) ==="]
+    for k, v in items:
+        lines.append(f"- {k} => {v}")
+    lines.append("=== END GLOSSARY ===\n\n")
+    return "\n".join(lines)
+
+
+def render_glossary_text(glossary: Optional[Dict[str, str]]) -> str:
+    if not glossary:
+        return ""
+    # Glossary không đổi trong suốt 1 job dịch → render N dòng một lần
+    # rồi dùng lại cho mọi chunk thay vì nối chuỗi lại 100 lần
+    return _render_glossary_items(tuple(glossary.items()))
+
+
+@functools.lru_cache(maxsize=8)
+def _chunk_user_prefix(source_lang: str, glossary_text: str) -> str:
+    # Phần đầu user message phải GIỐNG HỆT từng byte giữa các chunk để
+    # provider tái dùng prefix-cache (OpenAI tự cache prefix ≥1024 token,
+    # bỏ qua prefill → rẻ hơn và TTFT thấp hơn). rstrip() để khác biệt
+    # whitespace cuối file prompt không phá cache.
+    intro_text = load_intro_prompt(source_lang).rstrip()
+    return intro_text + "\n\n" + glossary_text
+
+
+@functools.lru_cache(maxsize=8)
+def _messages_template(source_lang: str, mode: str) -> List[dict]:
+    # 2 message đầu bất biến trong cả job → dựng 1 lần; caller copy nông
+    # list rồi thay mỗi message user cuối (các dict system/assistant dùng
+    # chung, không ai ghi đè)
+    return [
+        {"role": "system", "content": load_system_prompt(source_lang, mode)},
+        {"role": "assistant", "content": load_assistant_prompt(source_lang, mode)},
+        {"role": "user", "content": ""},
+    ]
+
+
+def _build_chunk_messages(
+    chunk: str,
+    mode: str,
+    source_lang: str,
+    glossary: Optional[Dict[str, str]],
+    context: str = "",
+) -> List[dict]:
+    # Đuôi chunk trước (nếu có) đi kèm làm ngữ cảnh để câu mở đầu chunk
+    # này dịch mượt — model được dặn rõ là KHÔNG dịch lại phần đó
+    context_block = ""
+    if context:
+        context_block = (
+            "=== NGỮ CẢNH (chỉ tham khảo — KHÔNG dịch lại) ===\n"
+            + context
+            + "\n=== HẾT NGỮ CẢNH ===\n\n"
+        )
+
+    user_content = (
+        _chunk_user_prefix(source_lang, render_glossary_text(glossary)) + context_block + chunk
+    )
+
+    messages = _messages_template(source_lang, mode)[:]
+    messages[-1] = {"role": "user", "content": user_content}
+    return messages
+
+
 def translate_chunk(chunk: str, mode: str, source_lang: str, glossary: Optional[Dict[str, str]] = None) -> str:
+    messages = _build_chunk_messages(chunk, mode, source_lang, glossary)
+    model = _model_for_chunk(chunk)
+
+    key = _translate_cache_key(messages, model)
+    cached = _mem_cache_get(key)
+    if cached is not None:
+        return cached
+    if TRANSLATE_CACHE_ENABLED:
+        cached = _translate_cache_get(key)
+        if cached is not None:
+            _mem_cache_put(key, cached)
+            return cached
+
+    sem_vec = None
+    if SEMANTIC_CACHE_ENABLED:
+        try:
+            sem_hit, sem_vec = _semantic_cache_lookup(chunk, source_lang, mode)
+            if sem_hit is not None:
+                return sem_hit
+        except Exception as e:
+            logger.info(f"⚠️  Semantic cache lỗi ({e}), dịch bình thường.")
+
+    resp = get_client().chat.completions.create(
+        model=model,
+        temperature=0.0,
+        max_tokens=_max_tokens_for(chunk),
+        messages=messages,
+    )
+    if resp.choices[0].finish_reason == "length":
+        # Chạm trần max_tokens → bản dịch đứt giữa chừng. Gọi lại KHÔNG
+        # trần (trần chỉ là lưới chống lan man, không được phép cắt bản
+        # dịch thật)
+        logger.info("⚠️  Bản dịch chạm trần max_tokens → dịch lại không giới hạn...")
+        resp = get_client().chat.completions.create(
+            model=model,
+            temperature=0.0,
+            messages=messages,
+        )
+    result = resp.choices[0].message.content.strip()
+
+    if resp.choices[0].finish_reason == "length":
+        # Vẫn đứt (chạm trần của chính model) → trả về nhưng KHÔNG cache,
+        # kẻo bản cụt nằm lại trên đĩa qua các lần chạy sau
+        logger.info("⚠️  Bản dịch vẫn bị cắt ở giới hạn model, không lưu cache.")
+        return result
+
+    _mem_cache_put(key, result)
+    if TRANSLATE_CACHE_ENABLED:
+        _translate_cache_put(key, result)
+    if sem_vec is not None:
+        try:
+            _semantic_cache_add(source_lang, mode, sem_vec, result)
+        except Exception:
+            pass
+    return result
+
+
+def translate_chunk_stream(
+    chunk: str,
+    mode: str,
+    source_lang: str,
+    glossary: Optional[Dict[str, str]] = None,
+    out_fp=None,
+) -> str:
+    """
+    Như translate_chunk nhưng stream=True: từng mẩu dịch in ra stdout
+    (và ghi vào out_fp nếu có) NGAY khi về tới, nên người dùng thấy chữ
+    chạy sau TTFT thay vì ngồi chờ cả bản dịch. Trả về bản dịch đầy đủ.
+    """
+    messages = _build_chunk_messages(chunk, mode, source_lang, glossary)
+    model = _model_for_chunk(chunk)
+
+    key = _translate_cache_key(messages, model)
+    cached = _mem_cache_get(key)
+    if cached is None and TRANSLATE_CACHE_ENABLED:
+        cached = _translate_cache_get(key)
+        if cached is not None:
+            _mem_cache_put(key, cached)
+    if cached is not None:
+        sys.stdout.write(cached + "\n")
+        if out_fp is not None:
+            out_fp.write(cached)
+        return cached
+
+    stream = get_client().chat.completions.create(
+        model=model,
+        temperature=0.0,
+        max_tokens=_max_tokens_for(chunk),
+        messages=messages,
+        stream=True,
+    )
+    pieces: List[str] = []
+    finish_reason = None
+    for event in stream:
+        if not event.choices:
+            continue
+        piece = event.choices[0].delta.content or ""
+        if event.choices[0].finish_reason is not None:
+            finish_reason = event.choices[0].finish_reason
+        if piece:
+            pieces.append(piece)
+            sys.stdout.write(piece)
+            sys.stdout.flush()
+            if out_fp is not None:
+                out_fp.write(piece)
+    sys.stdout.write("\n")
+    result = "".join(pieces).strip()
+
+    if finish_reason == "length":
+        # Phần cụt đã stream ra stdout/out_fp rồi, không rút lại được —
+        # nhưng tuyệt đối không để bản cụt lọt vào cache
+        logger.info("⚠️  Bản dịch chạm trần max_tokens, bị cắt cụt — không lưu cache.")
+        return result
+
+    _mem_cache_put(key, result)
+    if TRANSLATE_CACHE_ENABLED:
+        _translate_cache_put(key, result)
+    return result
+
+
+async def translate_chunk_async(
+    chunk: str,
+    mode: str,
+    source_lang: str,
+    glossary: Optional[Dict[str, str]] = None,
+    context: str = "",
+) -> str:
+    """
+    Bản async của translate_chunk (dùng aclient); nội dung messages y hệt.
+
+    Lỗi tạm thời (429, đứt kết nối, timeout) được retry tối đa
+    TRANSLATE_MAX_ATTEMPTS lần với backoff mũ + jitter, để một chunk
+    trục trặc không đánh sập cả job sau khi các chunk khác đã dịch xong.
+    """
+    messages = _build_chunk_messages(chunk, mode, source_lang, glossary, context=context)
+    model = _model_for_chunk(chunk)
+
+    key = _translate_cache_key(messages, model)
+    cached = _mem_cache_get(key)
+    if cached is not None:
+        return cached
+    if TRANSLATE_CACHE_ENABLED:
+        cached = _translate_cache_get(key)
+        if cached is not None:
+            _mem_cache_put(key, cached)
+            return cached
+
+    sem_vec = None
+    if SEMANTIC_CACHE_ENABLED:
+        try:
+            sem_hit, sem_vec = await asyncio.to_thread(
+                _semantic_cache_lookup, chunk, source_lang, mode
+            )
+            if sem_hit is not None:
+                return sem_hit
+        except Exception as e:
+            logger.info(f"⚠️  Semantic cache lỗi ({e}), dịch bình thường.")
+
+    for attempt in range(TRANSLATE_MAX_ATTEMPTS):
+        try:
+            resp = await get_async_client().chat.completions.create(
+                model=model,
+                temperature=0.0,
+                max_tokens=_max_tokens_for(chunk),
+                messages=messages,
+            )
+            if resp.choices[0].finish_reason == "length":
+                # Trần max_tokens cắt cụt bản dịch → gọi lại không trần
+                # (xem translate_chunk)
+                logger.info("⚠️  Bản dịch chạm trần max_tokens → dịch lại không giới hạn...")
+                resp = await get_async_client().chat.completions.create(
+                    model=model,
+                    temperature=0.0,
+                    messages=messages,
+                )
+            result = resp.choices[0].message.content.strip()
+            if resp.choices[0].finish_reason == "length":
+                logger.info("⚠️  Bản dịch vẫn bị cắt ở giới hạn model, không lưu cache.")
+                return result
+            _mem_cache_put(key, result)
+            if TRANSLATE_CACHE_ENABLED:
+                _translate_cache_put(key, result)
+            if sem_vec is not None:
+                try:
+                    await asyncio.to_thread(
+                        _semantic_cache_add, source_lang, mode, sem_vec, result
+                    )
+                except Exception:
+                    pass
+            return result
+        except _RETRYABLE_ERRORS as e:
+            if attempt == TRANSLATE_MAX_ATTEMPTS - 1:
+                raise
+            delay = random.uniform(1.0, min(30.0, 2.0 ** (attempt + 1)))
+            logger.info(f"⚠️  Lỗi tạm thời ({type(e).__name__}), thử lại sau {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+
+def extract_and_translate_small(
+    text: str,
+    mode: str = DEFAULT_MODE,
+    source_lang: str = "zh",
+    glossary: Optional[Dict[str, str]] = None,
+) -> tuple:
+    """
+    Small-input fast path: ONE LLM call that returns both the proper-noun
+    list and the translation → JSON {"items": [...], "translation": "..."}.
+    Saves the separate extract_proper_nouns round trip on short documents.
+    Returns (translation, names). If the model ignores the JSON format,
+    treat the raw reply as the translation and return no names.
+    """
     system_prompt = load_system_prompt(source_lang, mode)
     assistant_prompt = load_assistant_prompt(source_lang, mode)
     intro_text = load_intro_prompt(source_lang)
 
-    glossary_text = ""
-    if glossary:
-        glossary_text = (
-            "=== GLOSSARY (THAM KHẢO, HOA/THƯỜNG tùy theo hoàn cảnh mà sửa đổi) ===\n"
-        )
-        for k, v in glossary.items():
-            glossary_text += f"- {k} => {v}\n"
-        glossary_text += "=== END GLOSSARY ===\n\n"
+    json_instruction = (
+        "=== OUTPUT FORMAT ===\n"
+        "Trả về JSON DUY NHẤT theo schema:\n"
+        '{"items": ["tên riêng/chức tước xuất hiện trong văn bản"], "translation": "bản dịch đầy đủ"}\n'
+        "Không markdown, không code fence, không giải thích.\n"
+        "=== END OUTPUT FORMAT ===\n\n"
+    )
 
-    user_content = intro_text + "\n\n" + glossary_text + chunk
+    user_content = intro_text + "\n\n" + json_instruction + render_glossary_text(glossary) + text
 
-    resp = client.chat.completions.create(
+    resp = get_client().chat.completions.create(
         model=MODEL_NAME,
         temperature=0.0,
         messages=[
@@ -410,7 +1186,18 @@ def translate_chunk(chunk: str, mode: str, source_lang: str, glossary: Optional[
             {"role": "user", "content": user_content},
         ],
     )
-    return resp.choices[0].message.content.strip()
+    raw = (resp.choices[0].message.content or "").strip()
+
+    data = safe_json_extract_first_object(raw)
+    if isinstance(data, dict) and isinstance(data.get("translation"), str):
+        names = data.get("items")
+        if not isinstance(names, list):
+            names = []
+        names = [str(n).strip() for n in names if str(n).strip()]
+        return data["translation"].strip(), names
+
+    # Model không chịu trả JSON → coi toàn bộ reply là bản dịch
+    return strip_code_fence(raw), []
 
 
 def translate_big_text(
@@ -418,7 +1205,176 @@ def translate_big_text(
     mode: str = DEFAULT_MODE,
     source_lang: str = "zh",
     glossary: Optional[Dict[str, str]] = None,
+    out_fp=None,
+) -> Optional[str]:
+    """
+    Có out_fp thì ghi từng chunk dịch xong thẳng vào đó (không dựng chuỗi
+    kết quả khổng lồ trong RAM) và trả về None; không có thì trả về chuỗi.
+    """
+    text = text.strip()
+    if not text:
+        if out_fp is None:
+            return ""
+        return None
+
+    if len(text) <= 6000:
+        # 1 chunk → stream thẳng ra màn hình, thấy chữ chạy ngay sau TTFT
+        result = translate_chunk_stream(
+            text, mode=mode, source_lang=source_lang, glossary=glossary, out_fp=out_fp
+        )
+        return None if out_fp is not None else result
+
+    chunks = split_text_to_chunks(text, max_chars=6000)
+    logger.info(f"🔍 Long text detected → split into {len(chunks)} chunks.\n")
+
+    # Mỗi chunk (trừ chunk đầu) mang theo đuôi chunk trước làm ngữ cảnh.
+    # Chunk trùng nhau VỚI CÙNG ngữ cảnh (điệp khúc thơ, header chương lặp
+    # lại...) chỉ dịch 1 lần
+    jobs: List[tuple] = []
+    job_index: Dict[tuple, int] = {}
+    order: List[int] = []
+    for i, ch in enumerate(chunks):
+        context = chunks[i - 1][-CONTEXT_OVERLAP_CHARS:] if i else ""
+        key = (context, ch)
+        if key not in job_index:
+            job_index[key] = len(jobs)
+            jobs.append(key)
+        order.append(job_index[key])
+    if len(jobs) < len(chunks):
+        logger.info(f"♻️  {len(chunks) - len(jobs)} chunk trùng lặp → chỉ dịch {len(jobs)} chunk.")
+
+    # Các chunk độc lập với nhau (glossary chỉ đọc) → dịch song song qua
+    # asyncio.gather; semaphore chặn số request đồng thời
+    logger.info(f"⏳ Translating {len(jobs)} chunks (tối đa {MAX_CONCURRENCY} đồng thời)...")
+
+    async def _run() -> List[Optional[str]]:
+        sem = asyncio.Semaphore(MAX_CONCURRENCY)
+        results: List[Optional[str]] = [None] * len(jobs)
+        flushed = 0
+
+        def _flush_ready() -> None:
+            # Ghi ra file NGAY khi đoạn đầu-file kế tiếp đã dịch xong,
+            # không đợi cả job — chunk về sai thứ tự thì nằm chờ trong
+            # results tới lượt
+            nonlocal flushed
+            if out_fp is None:
+                return
+            while flushed < len(order) and results[order[flushed]] is not None:
+                if flushed:
+                    out_fp.write("\n\n")
+                out_fp.write(results[order[flushed]])
+                flushed += 1
+
+        async def worker(i: int, context: str, ch: str) -> None:
+            async with sem:
+                results[i] = await translate_chunk_async(
+                    ch, mode, source_lang, glossary, context=context
+                )
+            logger.info(f"   ✔ Done chunk {i + 1}/{len(jobs)}")
+            _flush_ready()
+
+        try:
+            await asyncio.gather(*(worker(i, ctx, ch) for i, (ctx, ch) in enumerate(jobs)))
+        finally:
+            await _close_async_client()
+        return results
+
+    unique_results = asyncio.run(_run())
+
+    logger.info("")
+    if out_fp is not None:
+        return None
+    return "\n\n".join(unique_results[j] for j in order)
+
+
+def translate_directory(
+    input_dir: str,
+    output_dir: str,
+    mode: str = DEFAULT_MODE,
+    source_lang: str = "zh",
+    glossary: Optional[Dict[str, str]] = None,
+) -> None:
+    """
+    Dịch cả thư mục *.txt trong MỘT process: mọi file dùng chung client
+    keep-alive, prompt cache và semaphore chunk toàn cục, thay vì chạy
+    script N lần trong vòng lặp shell (mỗi lần trả giá khởi động Python +
+    dựng client). Kết quả ghi vào output_dir với cùng tên file.
+    """
+    paths = sorted(Path(input_dir).glob("*.txt"))
+    if not paths:
+        print(f"❌ Không có file .txt nào trong {input_dir}")
+        return
+    os.makedirs(output_dir, exist_ok=True)
+    logger.info(f"📁 Dịch {len(paths)} file .txt từ {input_dir} → {output_dir}...")
+
+    async def _run() -> None:
+        # Semaphore CHUNG cho mọi file: tổng số request đồng thời vẫn bị
+        # chặn ở MAX_CONCURRENCY dù bao nhiêu file chạy song song
+        sem = asyncio.Semaphore(MAX_CONCURRENCY)
+
+        async def do_chunk(context: str, ch: str) -> str:
+            async with sem:
+                return await translate_chunk_async(
+                    ch, mode, source_lang, glossary, context=context
+                )
+
+        async def do_file(path: Path) -> None:
+            raw = await asyncio.to_thread(path.read_bytes)
+            # Đọc binary nên tự đổi CRLF về LF (xem main())
+            text = raw.decode("utf-8").replace("\r\n", "\n").strip()
+            if not text:
+                logger.info(f"⏭️  {path.name}: rỗng, bỏ qua.")
+                return
+            chunks = split_text_to_chunks(text, max_chars=6000)
+
+            jobs: List[tuple] = []
+            job_index: Dict[tuple, int] = {}
+            order: List[int] = []
+            for i, ch in enumerate(chunks):
+                context = chunks[i - 1][-CONTEXT_OVERLAP_CHARS:] if i else ""
+                key = (context, ch)
+                if key not in job_index:
+                    job_index[key] = len(jobs)
+                    jobs.append(key)
+                order.append(job_index[key])
+
+            results = await asyncio.gather(*(do_chunk(c, ch) for c, ch in jobs))
+            out_path = Path(output_dir) / path.name
+            await asyncio.to_thread(
+                out_path.write_text,
+                "\n\n".join(results[j] for j in order),
+                encoding="utf-8",
+            )
+            logger.info(f"   ✔ {path.name} ({len(chunks)} chunk)")
+
+        try:
+            await asyncio.gather(*(do_file(p) for p in paths))
+        finally:
+            await _close_async_client()
+
+    asyncio.run(_run())
+    print(f"✅ Done. {len(paths)} file đã dịch vào {output_dir}")
+
+
+# ==============================
+#        BATCH API (OFFLINE)
+# ==============================
+
+BATCH_POLL_SECONDS = 30
+
+
+def translate_big_text_batch(
+    text: str,
+    mode: str = DEFAULT_MODE,
+    source_lang: str = "zh",
+    glossary: Optional[Dict[str, str]] = None,
 ) -> str:
+    """
+    Dịch offline qua OpenAI Batch API: rẻ bằng nửa giá real-time và không
+    vướng rate limit, đổi lại phải chờ (cửa sổ 24h, thường xong sớm hơn
+    nhiều). Hợp với job dịch file dài chạy qua đêm. Văn bản ngắn (≤6000
+    ký tự) không đáng chờ → rơi về đường sync bình thường.
+    """
     text = text.strip()
     if not text:
         return ""
@@ -427,25 +1383,109 @@ def translate_big_text(
         return translate_chunk(text, mode=mode, source_lang=source_lang, glossary=glossary)
 
     chunks = split_text_to_chunks(text, max_chars=6000)
-    print(f"🔍 Long text detected → split into {len(chunks)} chunks.\n")
+    logger.info(f"🔍 Long text detected → split into {len(chunks)} chunks (Batch API).\n")
+
+    # Chunk trùng (cùng ngữ cảnh) chỉ gửi 1 dòng batch — cùng logic dedupe
+    # với đường async
+    jobs: List[tuple] = []
+    job_index: Dict[tuple, int] = {}
+    order: List[int] = []
+    for i, ch in enumerate(chunks):
+        context = chunks[i - 1][-CONTEXT_OVERLAP_CHARS:] if i else ""
+        key = (context, ch)
+        if key not in job_index:
+            job_index[key] = len(jobs)
+            jobs.append(key)
+        order.append(job_index[key])
+    if len(jobs) < len(chunks):
+        logger.info(f"♻️  {len(chunks) - len(jobs)} chunk trùng lặp → chỉ gửi {len(jobs)} dòng batch.")
+
+    # Mỗi job = 1 dòng JSONL, custom_id để ráp lại đúng thứ tự
+    lines = []
+    for j, (context, ch) in enumerate(jobs):
+        lines.append(_json_dumps_compact({
+            "custom_id": f"chunk-{j}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": _model_for_chunk(ch),
+                "temperature": 0.0,
+                "max_tokens": _max_tokens_for(ch),
+                "messages": _build_chunk_messages(ch, mode, source_lang, glossary, context=context),
+            },
+        }))
+    batch_input = ("\n".join(lines) + "\n").encode("utf-8")
+
+    logger.info("📤 Uploading batch input...")
+    input_file = get_client().files.create(file=("batch_input.jsonl", batch_input), purpose="batch")
+    batch = get_client().batches.create(
+        input_file_id=input_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.info(f"⏳ Batch {batch.id} submitted, đang chờ (poll mỗi {BATCH_POLL_SECONDS}s)...")
+
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        time.sleep(BATCH_POLL_SECONDS)
+        batch = get_client().batches.retrieve(batch.id)
+        logger.info(f"   … status: {batch.status}")
+
+    if batch.status != "completed":
+        raise RuntimeError(f"Batch {batch.id} kết thúc với status '{batch.status}'")
+
+    output_text = get_client().files.content(batch.output_file_id).text
+    results: Dict[int, str] = {}
+    for line in output_text.splitlines():
+        if not line.strip():
+            continue
+        obj = _json_loads(line)
+        idx = int(obj["custom_id"].split("-", 1)[1])
+        # Request lỗi trong batch có "response": null + object "error" →
+        # bỏ qua, để check missing bên dưới báo đủ danh sách thay vì nổ
+        # TypeError sau nhiều giờ chờ batch
+        response = obj.get("response")
+        if not response or response.get("status_code", 200) != 200:
+            err = (obj.get("error") or {}).get("message") or (response or {}).get("status_code")
+            logger.info(f"⚠️  chunk-{idx} lỗi trong batch: {err}")
+            continue
+        body = response["body"]
+        choice = body["choices"][0]
+        if choice.get("finish_reason") == "length":
+            logger.info(f"⚠️  chunk-{idx} chạm trần max_tokens trong batch, bản dịch có thể bị cắt cụt.")
+        results[idx] = choice["message"]["content"].strip()
 
-    translated_chunks: List[str] = []
-    for i, ch in enumerate(chunks, start=1):
-        print(f"⏳ Translating chunk {i}/{len(chunks)} ...")
-        t = translate_chunk(ch, mode=mode, source_lang=source_lang, glossary=glossary)
-        translated_chunks.append(t)
-        print(f"   ✔ Done chunk {i}\n")
+    missing = [j for j in range(len(jobs)) if j not in results]
+    if missing:
+        raise RuntimeError(f"Batch thiếu kết quả cho {len(missing)} chunk: {missing[:5]}...")
 
-    return "\n\n".join(translated_chunks)
+    logger.info("✅ Batch hoàn tất.\n")
+    return "\n\n".join(results[j] for j in order)
 
 
 # ==============================
 #              MAIN
 # ==============================
 
+def _warmup_client() -> None:
+    # Mở sẵn kết nối TCP+TLS tới API (models.retrieve không tốn token) để
+    # request dịch đầu tiên dùng lại kết nối trong pool thay vì bắt tay mới
+    preload_default_prompts()
+    try:
+        get_client().models.retrieve(MODEL_NAME)
+    except Exception:
+        pass
+
+
 def main():
+    batch_mode = "--batch" in sys.argv[1:]
+
+    # Warmup chạy nền, chồng lấp với lúc người dùng gõ đường dẫn + đọc file
+    threading.Thread(target=_warmup_client, daemon=True).start()
+
     print("=== Translation CLI ===")
     print("This script will translate a text file into Vietnamese.")
+    if batch_mode:
+        print("🗂️  Chế độ --batch: dùng OpenAI Batch API (rẻ 50%, chờ offline).")
     print("Supported language codes:")
     print("  auto, zh, hv, en, th, lo, fr, other")
     print()
@@ -455,6 +1495,22 @@ def main():
         print(f"❌ Input file not found: {input_path}")
         return
 
+    # ===== Directory mode: dịch cả thư mục *.txt trong một lần chạy =====
+    if os.path.isdir(input_path):
+        output_dir = input("Enter output directory (default: output): ").strip() or "output"
+        source_lang = input(
+            "Enter source language code [auto, zh, hv, en, th, lo, fr, other] (default: zh): "
+        ).strip().lower() or "zh"
+        glossary = load_glossary(GLOSSARY_PATH) if os.path.exists(GLOSSARY_PATH) else {}
+        translate_directory(
+            input_path,
+            output_dir,
+            mode=DEFAULT_MODE,
+            source_lang=source_lang,
+            glossary=glossary if glossary else None,
+        )
+        return
+
     output_path = input("Enter output file path (default: output.txt): ").strip() or "output.txt"
 
     source_lang = input(
@@ -463,8 +1519,11 @@ def main():
 
     mode = DEFAULT_MODE
 
-    with open(input_path, "r", encoding="utf-8") as f:
-        sample_text = f.read().strip()
+    # read_bytes + decode 1 lần: bớt một bản copy trung gian so với
+    # open().read() qua TextIOWrapper trên file đầu vào lớn. Đọc binary
+    # thì mất universal newline → tự đổi CRLF (file Windows) về LF, nếu
+    # không split_text_to_chunks sẽ không thấy "\n\n" nào để tách đoạn
+    sample_text = Path(input_path).read_bytes().decode("utf-8").replace("\r\n", "\n").strip()
 
     if not sample_text:
         print("❌ Input file is empty, nothing to translate.")
@@ -481,6 +1540,31 @@ def main():
             if reuse != "n":
                 glossary = load_glossary(GLOSSARY_PATH)
 
+        # ===== Small-input fast path: 1 LLM call = extract + translate =====
+        if len(sample_text) <= SMALL_COMBINED_MAX_CHARS:
+            print("⚡ Văn bản ngắn → gộp trích tên riêng + dịch vào MỘT lần gọi LLM...")
+            translated, names = extract_and_translate_small(
+                sample_text,
+                mode=mode,
+                source_lang=source_lang,
+                glossary=glossary if glossary else None,
+            )
+
+            # Bổ sung glossary từ các tên mới cho những lần chạy sau
+            norm_existing = {normalize_key(k) for k in glossary.keys()}
+            missing = [n for n in names if normalize_key(n) and normalize_key(n) not in norm_existing]
+            if missing:
+                print(f"📚 Bổ sung {len(missing)} tên mới vào glossary (cho lần chạy sau)...")
+                glossary.update(build_glossary_from_hvdic(missing, existing=glossary, print_result=True))
+            save_glossary(GLOSSARY_PATH, glossary)
+            print(f"💾 Đã lưu glossary vào {GLOSSARY_PATH}\n")
+
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(translated)
+
+            print(f"✅ Done. Result saved to {output_path}")
+            return
+
         # normalize map for "already have" check
         norm_existing = {normalize_key(k): k for k in glossary.keys()}
 
@@ -521,15 +1605,25 @@ def main():
     input("\n=== Press Enter to continue ===\n")
 
     glossary = load_glossary(GLOSSARY_PATH)
-    translated = translate_big_text(
-        sample_text,
-        mode=mode,
-        source_lang=source_lang,
-        glossary=glossary if glossary else None,
-    )
-
-    with open(output_path, "w", encoding="utf-8") as f:
-        f.write(translated)
+    if batch_mode:
+        translated = translate_big_text_batch(
+            sample_text,
+            mode=mode,
+            source_lang=source_lang,
+            glossary=glossary if glossary else None,
+        )
+        with open(output_path, "w", encoding="utf-8") as f:
+            f.write(translated)
+    else:
+        # Ghi thẳng từng chunk vào file thay vì gom cả bản dịch trong RAM
+        with open(output_path, "w", encoding="utf-8") as f:
+            translate_big_text(
+                sample_text,
+                mode=mode,
+                source_lang=source_lang,
+                glossary=glossary if glossary else None,
+                out_fp=f,
+            )
 
     print(f"✅ Done. Result saved to {output_path}")
 